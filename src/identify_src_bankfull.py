@@ -9,14 +9,16 @@ import shutil
 import sys
 import traceback
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
-from multiprocessing import Pool
 from os.path import dirname, isdir, isfile, join
 from pathlib import Path
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import seaborn as sns
+from numba import njit
 from tqdm import tqdm
 
 
@@ -38,32 +40,44 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
         Optional: Flag to create SRC plots for all hydroids (True/False)
 """
 
+## NWM bankfull flow lookup series (set once per worker by init_bankfull_flows)
+bankfull_flows = None
+
+
+def init_bankfull_flows(bflows):
+    ## Store the bankfull flows on each worker to avoid pickling the series with every branch task
+    global bankfull_flows
+    bankfull_flows = bflows
+
 
 def src_bankfull_lookup(args):
     src_full_filename = args[0]
     src_usecols = args[1]
-    df_bflows = args[2]
-    huc = args[3]
-    branch_id = args[4]
-    src_plot_option = args[5]
-    huc_output_dir = args[6]
+    huc = args[2]
+    branch_id = args[3]
+    src_plot_option = args[4]
+    huc_output_dir = args[5]
 
     ## Read the src_full_crosswalked.csv
     print('Calculating bankfull: ' + str(huc) + '  branch id: ' + str(branch_id))
     log_text = 'Calculating: ' + str(huc) + '  branch id: ' + str(branch_id) + '\n'
     try:
         df_src = pd.read_csv(
-            src_full_filename, usecols=src_usecols, dtype={'HydroID': int, 'feature_id': int}
+            src_full_filename,
+            usecols=src_usecols,
+            dtype={'HydroID': 'int32', 'feature_id': 'int64'},
+            engine='pyarrow',
         )
 
-        ## NWM recurr rename discharge var
-        df_bflows = df_bflows.rename(columns={'discharge': 'bankfull_flow'})
-
         ## Combine the nwm bankfull estimated flows into the SRC via feature_id
-        df_src = df_src.merge(df_bflows, how='left', on='feature_id')
+        bankfull_flow = df_src['feature_id'].map(bankfull_flows).to_numpy(dtype=np.float64, copy=True)
 
         ## Check if there are any missing data, negative or zero flow values in the bankfull_flow
-        check_null = df_src['bankfull_flow'].isnull().sum()
+        #   (fill missing/nan nwm bankfull_flow values with -999 to handle later)
+        missing_flow = np.isnan(bankfull_flow)
+        check_null = np.count_nonzero(missing_flow)
+        bankfull_flow[missing_flow] = -999
+        df_src['bankfull_flow'] = bankfull_flow
         if check_null > 0:
             log_text += (
                 'WARNING: Missing feature_id in crosswalk for huc: '
@@ -74,10 +88,8 @@ def src_bankfull_lookup(args):
                 + str(check_null / 84)
                 + ' features) \n'
             )
-            ## Fill missing/nan nwm bankfull_flow values with -999 to handle later
-            df_src['bankfull_flow'] = df_src['bankfull_flow'].fillna(-999)
 
-        negative_flows = len(df_src.loc[(df_src.bankfull_flow <= 0) & (df_src.bankfull_flow != -999)])
+        negative_flows = np.count_nonzero((bankfull_flow <= 0) & (bankfull_flow != -999))
 
         if negative_flows > 0:
             log_text += (
@@ -95,12 +107,13 @@ def src_bankfull_lookup(args):
         bedarea_var = 'BedArea (m2)'
 
         ## Locate the closest SRC discharge value to the NWM bankfull estimated flow
-        df_src['Q_bfull_find'] = (df_src['bankfull_flow'] - df_src['Discharge (m3s-1)']).abs()
+        q_bfull_find = np.abs(bankfull_flow - df_src['Discharge (m3s-1)'].to_numpy())
 
         ## Check for any missing/null entries in the input SRC
         # There may be null values for lake or coastal flow lines
-        # (need to set a value to do groupby idxmin below)
-        if df_src['Q_bfull_find'].isnull().values.any():
+        # (need to set a value to do the min lookup below)
+        q_bfull_null = np.isnan(q_bfull_find)
+        if q_bfull_null.any():
             log_text += (
                 'WARNING: HUC: '
                 + str(huc)
@@ -109,7 +122,7 @@ def src_bankfull_lookup(args):
                 + ' --> Null values found in "Q_bfull_find" calc. These will be filled with 999999 () \n'
             )
             ## Fill missing/nan nwm 'Discharge (m3s-1)' values with 999999 to handle later
-            df_src['Q_bfull_find'] = df_src['Q_bfull_find'].fillna(999999)
+            q_bfull_find[q_bfull_null] = 999999
         if df_src['HydroID'].isnull().values.any():
             log_text += (
                 'WARNING: HUC: '
@@ -119,17 +132,16 @@ def src_bankfull_lookup(args):
                 + ' --> Null values found in "HydroID"... \n'
             )
 
-        df_bankfull_calc = df_src[
-            ['Stage', 'HydroID', bedarea_var, volume_var, hradius_var, surface_area_var, 'Q_bfull_find']
-        ]  # create new subset df to perform the Q_1_5 lookup
-        df_bankfull_calc = df_bankfull_calc[
-            df_bankfull_calc['Stage'] > 0.0
-        ]  # Ensure bankfull stage is greater than stage=0
-        df_bankfull_calc = df_bankfull_calc.reset_index(drop=True)
-        # find the index of the Q_bfull_find (closest matching flow)
-        df_bankfull_calc = df_bankfull_calc.loc[
-            df_bankfull_calc.groupby('HydroID')['Q_bfull_find'].idxmin()
-        ].reset_index(drop=True)
+        ## Perform the Q_1_5 lookup on the SRC rows with stage > 0 (ensure bankfull stage is greater than stage=0)
+        #   (only the selected row for each HydroID is copied out of df_src)
+        calc_idx = np.flatnonzero(df_src['Stage'].to_numpy() > 0.0)
+        # find the row with the min Q_bfull_find (closest matching flow) for each HydroID
+        #   (codes are factorized in sorted HydroID order for the index-aligned join back into df_src)
+        hydroid_codes, hydroid_uniques = pd.factorize(df_src['HydroID'].to_numpy()[calc_idx], sort=True)
+        min_idx = find_group_min_idx(hydroid_codes, q_bfull_find[calc_idx], len(hydroid_uniques))
+        df_bankfull_calc = df_src.iloc[calc_idx[min_idx]][
+            ['Stage', 'HydroID', bedarea_var, volume_var, hradius_var, surface_area_var]
+        ].set_index('HydroID')
         # rename volume to use later for channel portion calc
         df_bankfull_calc = df_bankfull_calc.rename(
             columns={
@@ -140,67 +152,34 @@ def src_bankfull_lookup(args):
                 surface_area_var: 'SurfArea_bankfull',
             }
         )
-        df_src = df_src.merge(
+        df_src = df_src.join(
             df_bankfull_calc[
                 [
                     'Stage_bankfull',
-                    'HydroID',
                     'BedArea_bankfull',
                     'Volume_bankfull',
                     'HRadius_bankfull',
                     'SurfArea_bankfull',
                 ]
             ],
-            how='left',
             on='HydroID',
+            how='left',
+            validate='many_to_one',
         )
-        df_src = df_src.drop(['Q_bfull_find'], axis=1)
-
-        ## The bankfull ratio variables below were previously used for the composite variable roughness routine
-        ##      (not currently implimented)
-        # ## Calculate the channel portion of bankfull Volume
-        # df_src['chann_volume_ratio'] = 1.0 # At stage=0 set channel_ratio to 1.0 (avoid div by 0)
-        # df_src['chann_volume_ratio'].where(
-        #     df_src['Stage'] == 0, df_src['Volume_bankfull'] / (df_src[volume_var]), inplace=True
-        # )
-        # #df_src['chann_volume_ratio'] = df_src['chann_volume_ratio'].clip_upper(1.0)
-        # # set > 1.0 ratio values to 1.0 (these are within the channel)
-        # df_src['chann_volume_ratio'].where(df_src['chann_volume_ratio'] <= 1.0, 1.0, inplace=True)
-        # # if the bankfull_flow value <= 0 then set channel ratio to 0 (will use global overbank manning n)
-        # df_src['chann_volume_ratio'].where(df_src['bankfull_flow'] > 0.0, 0.0, inplace=True)
-        # #df_src = df_src.drop(['Volume_bankfull'], axis=1)
-
-        # ## Calculate the channel portion of bankfull Hydraulic Radius
-        # df_src['chann_hradius_ratio'] = 1.0 # At stage=0 set channel_ratio to 1.0 (avoid div by 0)
-        # df_src['chann_hradius_ratio'].where(
-        #     df_src['Stage'] == 0, df_src['HRadius_bankfull'] / (df_src[hradius_var]), inplace=True
-        # )
-        # # old adding 0.01 to avoid dividing by 0 at stage=0
-        # #df_src['chann_hradius_ratio'] = df_src['HRadius_bankfull'] / (df_src[hradius_var]+.0001)
-        # # set > 1.0 ratio values to 1.0 (these are within the channel)
-        # df_src['chann_hradius_ratio'].where(df_src['chann_hradius_ratio'] <= 1.0, 1.0, inplace=True)
-        # # if the bankfull_flow value <= 0 then set channel ratio to 0 (will use global overbank manning n)
-        # df_src['chann_hradius_ratio'].where(df_src['bankfull_flow'] > 0.0, 0.0, inplace=True)
-        # #df_src = df_src.drop(['HRadius_bankfull'], axis=1)
-
-        # ## Calculate the channel portion of bankfull Surface Area
-        # df_src['chann_surfarea_ratio'] = 1.0 # At stage=0 set channel_ratio to 1.0 (avoid div by 0)
-        # df_src['chann_surfarea_ratio'].where(
-        #     df_src['Stage'] == 0, df_src['SurfArea_bankfull'] / (df_src[surface_area_var]), inplace=True
-        # )
-        # # set > 1.0 ratio values to 1.0 (these are within the channel)
-        # df_src['chann_surfarea_ratio'].where(df_src['chann_surfarea_ratio'] <= 1.0, 1.0, inplace=True)
-        # # if the bankfull_flow value <= 0 then set channel ratio to 0 (will use global overbank manning n)
-        # df_src['chann_surfarea_ratio'].where(df_src['bankfull_flow'] > 0.0, 0.0, inplace=True)
-        # #df_src = df_src.drop(['HRadius_bankfull'], axis=1)
 
         ## mask bankfull variables when the bankfull estimated flow value is <= 0
-        df_src['Stage_bankfull'].mask(df_src['bankfull_flow'] <= 0.0, inplace=True)
+        overbank = bankfull_flow <= 0.0
+        stage_bankfull = df_src['Stage_bankfull'].to_numpy(copy=True)
+        stage_bankfull[overbank] = np.nan
+        df_src['Stage_bankfull'] = stage_bankfull
 
         ## Create a new column to identify channel/floodplain via the bankfull stage value
-        df_src.loc[df_src['Stage'] <= df_src['Stage_bankfull'], 'bankfull_proxy'] = 'channel'
-        df_src.loc[df_src['Stage'] > df_src['Stage_bankfull'], 'bankfull_proxy'] = 'floodplain'
-        df_src['bankfull_proxy'] = df_src['bankfull_proxy'].fillna('channel')
+        #   (missing bankfull stage values default to 'channel')
+        stage = df_src['Stage'].to_numpy()
+        df_src['bankfull_proxy'] = pd.Categorical.from_codes(
+            (stage > np.where(np.isnan(stage_bankfull), np.inf, stage_bankfull)).astype(np.int8),
+            categories=['channel', 'floodplain'],
+        )
 
         ## Output new SRC with bankfull column
         df_src.to_csv(src_full_filename, index=False)
@@ -208,6 +187,16 @@ def src_bankfull_lookup(args):
 
         ## plot rating curves (optional arg)
         if src_plot_option:
+            ## Calculate the channel portion of the bankfull Volume, Hydraulic Radius, and Surface Area
+            #   (previously used for the composite variable roughness routine - now only used for plotting)
+            for ratio_var, bankfull_var, src_var in [
+                ('chann_volume_ratio', 'Volume_bankfull', volume_var),
+                ('chann_hradius_ratio', 'HRadius_bankfull', hradius_var),
+                ('chann_surfarea_ratio', 'SurfArea_bankfull', surface_area_var),
+            ]:
+                df_src[ratio_var] = calc_chann_ratio(
+                    df_src[bankfull_var].to_numpy(), df_src[src_var].to_numpy(), stage, overbank
+                )
             if isdir(huc_output_dir) is False:
                 os.mkdir(huc_output_dir)
             generate_src_plot(df_src, huc_output_dir)
@@ -230,43 +219,85 @@ def src_bankfull_lookup(args):
     return log_text
 
 
+@njit
+def find_group_min_idx(group_codes, values, n_groups):
+    ## Return the row index of the min value for each group (first occurrence of ties - same as idxmin)
+    min_idx = np.full(n_groups, -1, dtype=np.int64)
+    min_values = np.empty(n_groups, dtype=np.float64)
+    for i in range(group_codes.size):
+        code = group_codes[i]
+        if min_idx[code] == -1 or values[i] < min_values[code]:
+            min_idx[code] = i
+            min_values[code] = values[i]
+    return min_idx
+
+
+def calc_chann_ratio(bankfull_values, src_values, stage, overbank):
+    """
+    Calculate the channel portion ratio (bankfull value / SRC value) for a channel geometry variable
+
+    Ratio is set to 1.0 at stage=0 (avoid div by 0) and for values > 1.0 (these are within the channel),
+    and set to 0.0 where the bankfull_flow value <= 0 (will use global overbank manning n)
+    """
+    ratio = np.ones(len(src_values), dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(bankfull_values, src_values, out=ratio, where=stage != 0)
+    # note: fmin (unlike clip/minimum) also sets nan ratios to 1.0
+    np.fmin(ratio, 1.0, out=ratio)
+    ratio[overbank] = 0.0
+    return ratio
+
+
 def generate_src_plot(df_src, plt_out_dir):
-    ## create list of unique hydroids
-    hydroids = df_src.HydroID.unique().tolist()
-    # hydroids = [17820017]
+    ## use the non-interactive backend and reuse a single figure for all of the hydroid plots
+    plt.switch_backend('Agg')
+    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
 
-    for hydroid in hydroids:
+    ## loop through the SRC rows grouped by unique hydroid
+    for hydroid, plot_df in df_src.groupby('HydroID', sort=False):
         print("Creating SRC plot: " + str(hydroid))
-        plot_df = df_src.loc[df_src['HydroID'] == hydroid]
 
-        fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+        discharge = plot_df['Discharge (m3s-1)'].to_numpy()
+        stage = plot_df['Stage'].to_numpy()
+        stage_bankfull = plot_df['Stage_bankfull'].to_numpy()
+        # bankfull stage is constant for each hydroid
+        stage_bankfull_value = stage_bankfull[0]
+
+        for ax in axes:
+            ax.cla()
+            ax.spines[['left', 'right', 'top', 'bottom']].set_visible(False)
         fig.suptitle(str(hydroid))
         axes[0].set_title('Rating Curve w/ Bankfull')
         axes[1].set_title('Channel Volume vs. HRadius Ratio')
-        sns.despine(fig, left=True, bottom=True)
-        sns.scatterplot(x='Discharge (m3s-1)', y='Stage', data=plot_df, ax=axes[0])
-        sns.lineplot(x='Discharge (m3s-1)', y='Stage_bankfull', data=plot_df, color='green', ax=axes[0])
-        axes[0].fill_between(plot_df['Discharge (m3s-1)'], plot_df['Stage_bankfull'], alpha=0.5)
+        axes[0].scatter(discharge, stage, s=36, edgecolors='w', linewidths=0.5)
+        axes[0].plot(discharge, stage_bankfull, color='green')
+        axes[0].fill_between(discharge, stage_bankfull, alpha=0.5)
         axes[0].text(
-            plot_df['Discharge (m3s-1)'].median(),
-            plot_df['Stage_bankfull'].median(),
-            "Bankfull Proxy Stage: " + str(plot_df['Stage_bankfull'].median()),
-        )
-        sns.scatterplot(
-            x='chann_volume_ratio', y='Stage', data=plot_df, ax=axes[1], label="chann_volume_ratio", s=38
-        )
-        sns.scatterplot(
-            x='chann_hradius_ratio', y='Stage', data=plot_df, ax=axes[1], label="chann_hradius_ratio", s=12
-        )
-        sns.scatterplot(
-            x='chann_surfarea_ratio', y='Stage', data=plot_df, ax=axes[1], label="chann_surfarea_ratio", s=12
+            np.median(discharge), stage_bankfull_value, "Bankfull Proxy Stage: " + str(stage_bankfull_value)
         )
+        axes[0].set_xlabel('Discharge (m3s-1)')
+        axes[0].set_ylabel('Stage')
+        for ratio_var, marker_size in [
+            ('chann_volume_ratio', 38),
+            ('chann_hradius_ratio', 12),
+            ('chann_surfarea_ratio', 12),
+        ]:
+            axes[1].scatter(
+                plot_df[ratio_var].to_numpy(),
+                stage,
+                s=marker_size,
+                edgecolors='w',
+                linewidths=0.3,
+                label=ratio_var,
+            )
+        axes[1].set_xlabel('chann_volume_ratio')
+        axes[1].set_ylabel('Stage')
         axes[1].legend()
-        plt.savefig(plt_out_dir + os.sep + str(hydroid) + '_bankfull.png', dpi=100, bbox_inches='tight')
-        plt.close()
+        fig.savefig(plt_out_dir + os.sep + str(hydroid) + '_bankfull.png', dpi=100, bbox_inches='tight')
+    plt.close(fig)
 
 
-def multi_process(src_bankfull_lookup, procs_list, log_file, number_of_jobs, verbose):
+def multi_process(src_bankfull_lookup, procs_list, bankfull_flows, log_file, number_of_jobs, verbose):
     ## Initiate multiprocessing
     available_cores = multiprocessing.cpu_count()
     if number_of_jobs > available_cores:
@@ -278,13 +309,14 @@ def multi_process(src_bankfull_lookup, procs_list, log_file, number_of_jobs, ver
         )
 
     print(f"Identifying bankfull stage for {len(procs_list)} branches using {number_of_jobs} jobs")
-    with Pool(processes=number_of_jobs) as pool:
-        # progress_bar = tqdm(total=len(procs_list[0]))
+    chunksize = max(1, len(procs_list) // (4 * number_of_jobs))
+    with ProcessPoolExecutor(
+        max_workers=number_of_jobs, initializer=init_bankfull_flows, initargs=(bankfull_flows,)
+    ) as executor:
+        map_output = executor.map(src_bankfull_lookup, procs_list, chunksize=chunksize)
         if verbose:
-            map_output = tqdm(pool.imap(src_bankfull_lookup, procs_list), total=len(procs_list))
-            tuple(map_output)  # fetch the lazy results
-        else:
-            map_output = pool.map(src_bankfull_lookup, procs_list)
+            map_output = tqdm(map_output, total=len(procs_list))
+        map_output = list(map_output)  # fetch the lazy results
     log_file.writelines(["%s\n" % item for item in map_output])
 
 
@@ -333,50 +365,48 @@ def run_prep(fim_dir, bankfull_flow_filepath, number_of_jobs, verbose, src_plot_
         'Bathymetry_source',
     ]
 
-    df_bflows = pd.read_csv(bankfull_flow_filepath, dtype={'feature_id': int})
-    huc_list = [d for d in os.listdir(fim_dir) if re.match(r'^\d{8}$', d)]
+    df_bflows = pd.read_csv(bankfull_flow_filepath, dtype={'feature_id': 'int64'})
+    ## Check that the bankfull flows have a single value per feature_id (required for the SRC lookup)
+    assert df_bflows['feature_id'].is_unique, 'ERROR: Duplicate feature_ids in the bankfull flow file'
+    ## Lookup series of the NWM recurr discharge var by feature_id (mapped to each branch SRC)
+    bankfull_flows = df_bflows.set_index('feature_id')['discharge']
+    is_huc = re.compile(r'\d{8}').fullmatch
+    with os.scandir(fim_dir) as fim_entries:
+        huc_list = [entry.name for entry in fim_entries if entry.is_dir() and is_huc(entry.name)]
     huc_list.sort()  # sort huc_list for helping track progress in future print statments
     huc_pass_list = []
     for huc in huc_list:
-        # if huc != 'logs' and huc[-3:] != 'log' and huc[-4:] != '.csv':
-        if re.match(r'\d{8}', huc):
-            huc_branches_dir = os.path.join(fim_dir, huc, 'branches')
-            for branch_id in os.listdir(huc_branches_dir):
-                branch_dir = os.path.join(huc_branches_dir, branch_id)
-                src_orig_full_filename = join(branch_dir, 'src_full_crosswalked_' + branch_id + '.csv')
-                huc_output_dir = join(branch_dir, 'src_plots')
-                ## Check if BARC modified src_full_crosswalked_BARC.csv exists otherwise use
-                #   orginial src_full_crosswalked.csv
-                if isfile(src_orig_full_filename):
-                    huc_pass_list.append(str(huc) + " --> src_full_crosswalked.csv")
-                    procs_list.append(
-                        [
-                            src_orig_full_filename,
-                            src_usecols,
-                            df_bflows,
-                            huc,
-                            branch_id,
-                            src_plot_option,
-                            huc_output_dir,
-                        ]
-                    )
-                else:
-                    print(
-                        f'HUC: {str(huc)}  branch id: {str(branch_id)}'
-                        'WARNING --> can not find the SRC crosswalked csv file in the fim output dir: '
-                        f' {str(branch_dir)}  - skipping this branch!!!\n'
-                    )
-                    log_file.write(
-                        f'HUC: {str(huc)}  branch id: {str(branch_id)}'
-                        'WARNING --> can not find the SRC crosswalked csv file in the fim output dir: '
-                        f' {str(branch_dir)}  - skipping this branch!!!\n'
-                    )
+        huc_branches_dir = os.path.join(fim_dir, huc, 'branches')
+        with os.scandir(huc_branches_dir) as branch_entries:
+            branch_ids = [entry.name for entry in branch_entries if entry.is_dir()]
+        for branch_id in branch_ids:
+            branch_dir = os.path.join(huc_branches_dir, branch_id)
+            src_orig_full_filename = join(branch_dir, 'src_full_crosswalked_' + branch_id + '.csv')
+            huc_output_dir = join(branch_dir, 'src_plots')
+            ## Check if BARC modified src_full_crosswalked_BARC.csv exists otherwise use
+            #   orginial src_full_crosswalked.csv
+            if isfile(src_orig_full_filename):
+                huc_pass_list.append(str(huc) + " --> src_full_crosswalked.csv")
+                procs_list.append(
+                    [src_orig_full_filename, src_usecols, huc, branch_id, src_plot_option, huc_output_dir]
+                )
+            else:
+                print(
+                    f'HUC: {str(huc)}  branch id: {str(branch_id)}'
+                    'WARNING --> can not find the SRC crosswalked csv file in the fim output dir: '
+                    f' {str(branch_dir)}  - skipping this branch!!!\n'
+                )
+                log_file.write(
+                    f'HUC: {str(huc)}  branch id: {str(branch_id)}'
+                    'WARNING --> can not find the SRC crosswalked csv file in the fim output dir: '
+                    f' {str(branch_dir)}  - skipping this branch!!!\n'
+                )
 
     log_file.writelines(["%s\n" % item for item in huc_pass_list])
     log_file.write('#########################################################\n\n')
 
     ## Pass huc procs_list to multiprocessing function
-    multi_process(src_bankfull_lookup, procs_list, log_file, number_of_jobs, verbose)
+    multi_process(src_bankfull_lookup, procs_list, bankfull_flows, log_file, number_of_jobs, verbose)
 
     ## Record run time and close log file
     end_time = dt.datetime.now()
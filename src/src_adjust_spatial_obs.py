@@ -56,6 +56,15 @@ Outputs
                                 "layer", and median "HAND" value
 '''
 
+## Calibration points for each HUC (set once per worker by init_huc_water_edge_dfs)
+huc_water_edge_dfs = None
+
+
+def init_huc_water_edge_dfs(water_edge_dfs):
+    ## Store the HUC points on each worker to avoid pickling a HUC's points with every branch task
+    global huc_water_edge_dfs
+    huc_water_edge_dfs = water_edge_dfs
+
 
 def process_points(args):
     '''
@@ -75,9 +84,9 @@ def process_points(args):
     hand_path = args[3]
     catchments_path = args[4]
     catchments_poly_path = args[5]
-    water_edge_df = args[6]
-    htable_path = args[7]
-    optional_outputs = args[8]
+    htable_path = args[6]
+    optional_outputs = args[7]
+    water_edge_df = huc_water_edge_dfs[huc]
 
     ## Define coords variable to be used in point raster value attribution.
     coords = [(x, y) for x, y in zip(water_edge_df.X, water_edge_df.Y)]
@@ -253,6 +262,7 @@ def ingest_points_layer(fim_directory, job_number, debug_outputs_option, log_fil
 
     # Initialize process list for multiprocessing.
     procs_list = []
+    water_edge_dfs = {}
 
     # huc_list = ['12040103'] # Uncomment for testing
     # Sort huc_list for helping track progress in future print statments
@@ -267,6 +277,7 @@ def ingest_points_layer(fim_directory, job_number, debug_outputs_option, log_fil
         ## Create X and Y location columns by extracting from geometry.
         water_edge_df['X'] = water_edge_df['geometry'].x
         water_edge_df['Y'] = water_edge_df['geometry'].y
+        water_edge_dfs[huc] = water_edge_df
 
         ## Check to make sure the HUC directory exists in the current fim_directory
         if not os.path.exists(os.path.join(fim_directory, huc)):
@@ -351,13 +362,12 @@ def ingest_points_layer(fim_directory, job_number, debug_outputs_option, log_fil
                         hand_path,
                         catchments_path,
                         catchments_poly_path,
-                        water_edge_df,
                         htable_path,
                         debug_outputs_option,
                     ]
                 )
 
-    with Pool(processes=job_number) as pool:
+    with Pool(processes=job_number, initializer=init_huc_water_edge_dfs, initargs=(water_edge_dfs,)) as pool:
         log_output = pool.map(process_points, procs_list)
         log_file.writelines(["%s\n" % item for item in log_output])
 
@@ -303,17 +303,13 @@ def branch_proc_list(usgs_df, run_dir, debug_outputs_option, log_file):
             df['HydroID'] = df['HydroID'].astype(int)
             df['NextDownID'] = df['NextDownID'].astype(int)
 
-            # Loop through every row in the "usgs_elev" dataframe
-            for index, row in usgs_elev.iterrows():
-                start_id = row['hydroid']
+            # Trace the network for every row in the "usgs_elev" dataframe
+            traces = [trace_network(df, start_id) for start_id in usgs_elev['hydroid']]
 
-                # Trace the network for each row
-                up, down = trace_network(df, start_id)
-
-                # Append the results to the "usgs_elev" dataframe
-                usgs_elev = usgs_elev.copy()
-                usgs_elev.loc[index, 'up'] = ','.join(map(str, up))
-                usgs_elev.loc[index, 'down'] = ','.join(map(str, down))
+            # Append the results to the "usgs_elev" dataframe (assign each column once)
+            usgs_elev = usgs_elev.copy()
+            usgs_elev['up'] = [','.join(map(str, up)) for up, down in traces]
+            usgs_elev['down'] = [','.join(map(str, down)) for up, down in traces]
 
             # Handle NaN values and ignore rows where up/down trace list is empty
             usgs_elev['up'] = (
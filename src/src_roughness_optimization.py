@@ -10,8 +10,11 @@ from multiprocessing import Pool
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import rasterio
 from geopandas.tools import sjoin
+from numba import njit
+from pyarrow import csv as pa_csv
 
 from utils.shared_variables import DOWNSTREAM_THRESHOLD, ROUGHNESS_MAX_THRESH, ROUGHNESS_MIN_THRESH
 
@@ -40,8 +43,8 @@ def update_rating_curve(
     Processing Steps:
     - Read in the hydroTable.csv and check whether it has previously been updated
         (rename default columns if needed)
-    - Loop through the user provided point data --> stage/flow dataframe row by row and copy the corresponding
-        htable values for the matching stage->HAND lookup
+    - Join the user provided point data --> stage/flow dataframe to the nearest htable stage and copy the
+        corresponding htable values for the matching stage->HAND lookup
     - Calculate new HydroID roughness values for input obs data using Manning's equation
     - Create dataframe to check for erroneous Manning's n values
         (values set in tools_shared_variables.py: >0.6 or <0.001 --> see input args)
@@ -114,7 +117,9 @@ def update_rating_curve(
     )
     log_text += "DOWNSTREAM_THRESHOLD: " + str(down_dist_thresh) + 'km\n'
     log_text += "Merge Previous Adj Values: " + str(merge_prev_adj) + '\n'
-    df_nvalues = water_edge_median_df.copy()
+    # shallow copy is enough here (the index reset only touches df_nvalues and the hydroid filter below
+    # returns a new frame before any values are modified)
+    df_nvalues = water_edge_median_df.copy(deep=False)
     df_nvalues.reset_index(inplace=True)
     df_nvalues = df_nvalues[
         (df_nvalues.hydroid.notnull()) & (df_nvalues.hydroid > 0)
@@ -132,9 +137,14 @@ def update_rating_curve(
 
     ## Read in the hydroTable.csv and check wether it has previously been updated
     # (rename default columns if needed)
-    df_htable = pd.read_csv(
-        htable_path, dtype={'HUC': object, 'last_updated': object, 'submitter': object, 'obs_source': object}
-    )
+    # (parse with the multithreaded pyarrow reader and keep the text attributes as strings - e.g. HUC leading 0)
+    df_htable = pa_csv.read_csv(
+        htable_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={col: pa.string() for col in ['HUC', 'last_updated', 'submitter', 'obs_source']},
+            strings_can_be_null=True,
+        ),
+    ).to_pandas()
     df_prev_adj = pd.DataFrame()  # initialize empty df for populating/checking later
     if 'precalb_discharge_cms' not in df_htable.columns:  # need this column to exist before continuing
         df_htable['calb_applied'] = False
@@ -156,7 +166,7 @@ def update_rating_curve(
     # calibration outputs
     if merge_prev_adj and not df_htable['calb_coef_final'].isnull().all():
         # Create a subset of hydrotable with previous adjusted SRC attributes
-        df_prev_adj_htable = df_htable.copy()[
+        df_prev_adj_htable = df_htable[
             ['HydroID', 'submitter', 'last_updated', 'obs_source', 'calb_coef_final']
         ]
         df_prev_adj_htable = df_prev_adj_htable.rename(
@@ -183,77 +193,112 @@ def update_rating_curve(
 
     # Delete previous adj columns to prevent duplicate variable issues
     # (if src_roughness_optimization.py was previously applied)
-    df_htable = df_htable.drop(
-        [
-            'discharge_cms',
-            'submitter',
-            'last_updated',
-            calb_type,
-            'calb_coef_final',
-            'calb_applied',
-            'obs_source',
-        ],
-        axis=1,
-        errors='ignore',
+    # (select the remaining columns and rename in one step to avoid restructuring the full htable twice)
+    prev_adj_cols = {
+        'discharge_cms',
+        'submitter',
+        'last_updated',
+        calb_type,
+        'calb_coef_final',
+        'calb_applied',
+        'obs_source',
+    }
+    df_htable = df_htable[[col for col in df_htable.columns if col not in prev_adj_cols]].rename(
+        columns={'precalb_discharge_cms': 'discharge_cms'}, copy=False
     )
-    df_htable = df_htable.rename(columns={'precalb_discharge_cms': 'discharge_cms'})
 
-    ## loop through the user provided point data --> stage/flow dataframe row by row
-    for index, row in df_nvalues.iterrows():
-        if row.hydroid not in df_htable['HydroID'].values:
-            print(
-                'WARNING: HydroID for calb point was not found in the hydrotable (check hydrotable) for HUC: '
-                + str(huc)
-                + '  branch id: '
-                + str(branch_id)
-                + ' hydroid: '
-                + str(row.hydroid)
-            )
-            log_text += (
-                'WARNING: HydroID for calb point was not found in the hydrotable (check hydrotable) for HUC: '
-                + str(huc)
-                + '  branch id: '
-                + str(branch_id)
-                + ' hydroid: '
-                + str(row.hydroid)
-                + '\n'
-            )
-        else:
-            # filter htable for entries with matching hydroid and ignore stage 0
-            # (first possible stage match at 1ft)
-            df_htable_hydroid = df_htable[(df_htable.HydroID == row.hydroid) & (df_htable.stage > 0)]
-            if df_htable_hydroid.empty:
-                print(
-                    'WARNING: df_htable_hydroid is empty but expected data: '
-                    + str(huc)
-                    + '  branch id: '
-                    + str(branch_id)
-                    + ' hydroid: '
-                    + str(row.hydroid)
-                )
-                log_text += (
-                    'WARNING: df_htable_hydroid is empty but expected data: '
-                    + str(huc)
-                    + '  branch id: '
-                    + str(branch_id)
-                    + ' hydroid: '
-                    + str(row.hydroid)
-                    + '\n'
-                )
+    ## Check the user provided point data --> stage/flow dataframe for hydroids missing from the htable
+    in_htable = df_nvalues['hydroid'].isin(df_htable['HydroID'])
+    for hydroid in df_nvalues.loc[~in_htable, 'hydroid']:
+        print(
+            'WARNING: HydroID for calb point was not found in the hydrotable (check hydrotable) for HUC: '
+            + str(huc)
+            + '  branch id: '
+            + str(branch_id)
+            + ' hydroid: '
+            + str(hydroid)
+        )
+        log_text += (
+            'WARNING: HydroID for calb point was not found in the hydrotable (check hydrotable) for HUC: '
+            + str(huc)
+            + '  branch id: '
+            + str(branch_id)
+            + ' hydroid: '
+            + str(hydroid)
+            + '\n'
+        )
 
-            find_src_stage = df_htable_hydroid.loc[
-                df_htable_hydroid['stage'].sub(row.hand).abs().idxmin()
-            ]  # find closest matching stage to the user provided HAND value
+    # subset the htable to the lookup attributes and ignore stage 0 (first possible stage match at 1ft)
+    # keep the first entry for duplicate stages so ties resolve to the first htable row
+    df_htable_stage = (
+        df_htable.loc[
+            df_htable['stage'] > 0,
+            [
+                'HydroID',
+                'stage',
+                'feature_id',
+                'LakeID',
+                'NextDownID',
+                'LENGTHKM',
+                'channel_n',
+                'overbank_n',
+                'discharge_cms',
+            ],
+        ]
+        .drop_duplicates(['HydroID', 'stage'], keep='first')
+        .astype({'stage': 'float64'})
+        .sort_values('stage', kind='stable')
+    )
+    for hydroid in df_nvalues.loc[
+        in_htable & ~df_nvalues['hydroid'].isin(df_htable_stage['HydroID']), 'hydroid'
+    ]:
+        print(
+            'WARNING: df_htable_hydroid is empty but expected data: '
+            + str(huc)
+            + '  branch id: '
+            + str(branch_id)
+            + ' hydroid: '
+            + str(hydroid)
+        )
+        log_text += (
+            'WARNING: df_htable_hydroid is empty but expected data: '
+            + str(huc)
+            + '  branch id: '
+            + str(branch_id)
+            + ' hydroid: '
+            + str(hydroid)
+            + '\n'
+        )
 
-            ## copy the corresponding htable values for the matching stage->HAND lookup
-            df_nvalues.loc[index, 'feature_id'] = find_src_stage.feature_id
-            df_nvalues.loc[index, 'LakeID'] = find_src_stage.LakeID
-            df_nvalues.loc[index, 'NextDownID'] = find_src_stage.NextDownID
-            df_nvalues.loc[index, 'LENGTHKM'] = find_src_stage.LENGTHKM
-            df_nvalues.loc[index, 'src_stage'] = find_src_stage.stage
-            df_nvalues.loc[index, 'channel_n'] = find_src_stage.channel_n
-            df_nvalues.loc[index, 'overbank_n'] = find_src_stage.overbank_n
-            df_nvalues.loc[index, 'discharge_cms'] = find_src_stage.discharge_cms
+    ## find closest matching stage to the user provided HAND value for every calb point in one join
+    # (merge_asof "nearest" resolves equal distance ties to the lower stage, same as the previous idxmin)
+    # (merge_asof requires identical key dtypes - HAND sampled from the float32 rem raster is upcast to
+    # float64 to match the htable stage)
+    df_obs_stage = (
+        df_nvalues.loc[in_htable & df_nvalues['hand'].notnull(), ['hydroid', 'hand']]
+        .astype({'hydroid': df_htable['HydroID'].dtype, 'hand': 'float64'})
+        .rename(columns={'hydroid': 'HydroID'})
+        .sort_values('hand', kind='stable')
+    )
+    df_src_stage = pd.merge_asof(
+        df_obs_stage, df_htable_stage, by='HydroID', left_on='hand', right_on='stage', direction='nearest'
+    )
+    df_src_stage.index = df_obs_stage.index
+    df_src_stage = df_src_stage.dropna(subset=['stage']).rename(columns={'stage': 'src_stage'})
+
+    ## copy the corresponding htable values for the matching stage->HAND lookup
+    if not df_src_stage.empty:
+        src_cols = [
+            'feature_id',
+            'LakeID',
+            'NextDownID',
+            'LENGTHKM',
+            'src_stage',
+            'channel_n',
+            'overbank_n',
+            'discharge_cms',
+        ]
+        df_nvalues.loc[df_src_stage.index, src_cols] = df_src_stage[src_cols].to_numpy(dtype='float64')
 
     if 'discharge_cms' not in df_nvalues:
         print(
@@ -282,17 +327,16 @@ def update_rating_curve(
     ## Create dataframe to check for unrealistic/egregious calibration adjustments by applying the calibration
     # coefficient to the Manning's n values and setting an acceptable range
     # (values set in tools_shared_variables.py --> >0.8 or <0.001)
-    df_nvalues['Mann_flag'] = np.where(
+    # (boolean flag: False indicates an erroneous calibration adjustment)
+    df_nvalues['Mann_valid'] = ~(
         (df_nvalues['channel_n_calb'] >= ROUGHNESS_MAX_THRESH)
         | (df_nvalues['overbank_n_calb'] >= ROUGHNESS_MAX_THRESH)
         | (df_nvalues['channel_n_calb'] <= ROUGHNESS_MIN_THRESH)
         | (df_nvalues['overbank_n_calb'] <= ROUGHNESS_MIN_THRESH)
-        | (df_nvalues['hydroid_calb_coef'].isnull()),
-        'Fail',
-        'Pass',
+        | (df_nvalues['hydroid_calb_coef'].isnull())
     )
-    df_mann_flag = df_nvalues[(df_nvalues['Mann_flag'] == 'Fail')][
-        ['HydroID', 'hydroid_calb_coef', 'channel_n_calb', 'overbank_n_calb']
+    df_mann_flag = df_nvalues.loc[
+        ~df_nvalues['Mann_valid'], ['HydroID', 'hydroid_calb_coef', 'channel_n_calb', 'overbank_n_calb']
     ]
     if not df_mann_flag.empty:
         log_text += '!!! Flaged Mannings Roughness values below !!!' + '\n'
@@ -309,9 +353,19 @@ def update_rating_curve(
     df_huc_lid.columns = pd.MultiIndex.from_product([['info'], df_huc_lid.columns])
 
     ## pivot the magnitude column to display n value for each magnitude at each hydroid
-    df_nvalues_mag = df_nvalues.pivot_table(
-        index='HydroID', columns='magnitude', values=['hydroid_calb_coef'], aggfunc='mean'
-    )  # if there are multiple entries per hydroid and magnitude - aggregate using mean
+    # (if there are multiple entries per hydroid and magnitude - aggregate using mean)
+    # (groupby/unstack avoids the intermediate frames built by pivot_table - all-NaN groups are dropped
+    # and magnitude columns sorted to match the pivot_table output)
+    df_nvalues_mag = (
+        df_nvalues.groupby(['HydroID', 'magnitude'])['hydroid_calb_coef']
+        .mean()
+        .dropna()
+        .unstack('magnitude')
+        .sort_index(axis=1)
+    )
+    df_nvalues_mag.columns = pd.MultiIndex.from_product(
+        [['hydroid_calb_coef'], df_nvalues_mag.columns], names=[None, 'magnitude']
+    )
 
     ## Optional: Export csv with the newly calculated Manning's N values
     if debug_outputs_option:
@@ -319,7 +373,7 @@ def update_rating_curve(
         df_nvalues.to_csv(output_calc_n_csv, index=False)
 
     ## filter the modified Manning's n dataframe for values out side allowable range
-    df_nvalues = df_nvalues[df_nvalues['Mann_flag'] == 'Pass']
+    df_nvalues = df_nvalues[df_nvalues['Mann_valid']]
 
     ## Check that there are valid entries in the calculate roughness df after filtering
     if not df_nvalues.empty:
@@ -330,21 +384,24 @@ def update_rating_curve(
         )  # sort by collection time and then drop duplicate HydroIDs (keep most recent coll_time per HydroID)
         df_updated = df_updated.rename(columns={'coll_time': 'last_updated'})
 
-        ## cacluate median ManningN to handle cases with multiple hydroid entries
-        df_mann_hydroid = df_nvalues.groupby(["HydroID"])[['hydroid_calb_coef']].median()
-
         ## Create a df with the median hydroid_ManningN value per feature_id
         # df_mann_featid = df_nvalues.groupby(["feature_id"])[['hydroid_ManningN']].mean()
         # df_mann_featid = df_mann_featid.rename(columns={'hydroid_ManningN':'featid_ManningN'})
 
         ## Rename the original hydrotable variables to allow new calculations to use the primary var name
-        df_htable = df_htable.rename(columns={'discharge_cms': 'precalb_discharge_cms'})
+        df_htable = df_htable.rename(columns={'discharge_cms': 'precalb_discharge_cms'}, copy=False)
 
         ## Check for large variabilty in the calculated Manning's N values
         # (for cases with mutliple entries for a singel hydroid)
-        df_nrange = df_nvalues.groupby('HydroID').agg(
-            {'hydroid_calb_coef': ['median', 'min', 'max', 'std', 'count']}
+        # (single grouper pass on the coef series - the median is reused below for df_mann_hydroid)
+        df_nrange = df_nvalues.groupby('HydroID')['hydroid_calb_coef'].agg(
+            ['median', 'min', 'max', 'std', 'count']
         )
+
+        ## cacluate median ManningN to handle cases with multiple hydroid entries
+        df_mann_hydroid = df_nrange[['median']].rename(columns={'median': 'hydroid_calb_coef'})
+
+        df_nrange.columns = pd.MultiIndex.from_product([['hydroid_calb_coef'], df_nrange.columns])
         df_nrange['hydroid_calb_coef', 'range'] = (
             df_nrange['hydroid_calb_coef', 'max'] - df_nrange['hydroid_calb_coef', 'min']
         )
@@ -416,25 +473,21 @@ def update_rating_curve(
                 # adjusted roughness value
                 if not df_prev_adj.empty:
                     df_nmerge = pd.merge(df_nmerge, df_prev_adj, on='HydroID', how='outer')
+                    # (hydroids without a new calb coef that do have a previous calb coef)
+                    use_prev = (
+                        df_nmerge[calb_type].isnull() & df_nmerge['calb_coef_final_prev'].notnull()
+                    ).to_numpy()
                     df_nmerge['submitter'] = np.where(
-                        (df_nmerge[calb_type].isnull() & df_nmerge['calb_coef_final_prev'].notnull()),
-                        df_nmerge['submitter_prev'],
-                        df_nmerge['submitter'],
+                        use_prev, df_nmerge['submitter_prev'], df_nmerge['submitter']
                     )
                     df_nmerge['last_updated'] = np.where(
-                        (df_nmerge[calb_type].isnull() & df_nmerge['calb_coef_final_prev'].notnull()),
-                        df_nmerge['last_updated_prev'],
-                        df_nmerge['last_updated'],
+                        use_prev, df_nmerge['last_updated_prev'], df_nmerge['last_updated']
                     )
                     df_nmerge['obs_source'] = np.where(
-                        (df_nmerge[calb_type].isnull() & df_nmerge['calb_coef_final_prev'].notnull()),
-                        df_nmerge['obs_source_prev'],
-                        df_nmerge['obs_source'],
+                        use_prev, df_nmerge['obs_source_prev'], df_nmerge['obs_source']
                     )
                     df_nmerge['calb_coef_final'] = np.where(
-                        (df_nmerge[calb_type].isnull() & df_nmerge['calb_coef_final_prev'].notnull()),
-                        df_nmerge['calb_coef_final_prev'],
-                        df_nmerge[calb_type],
+                        use_prev, df_nmerge['calb_coef_final_prev'], df_nmerge[calb_type]
                     )
                     df_nmerge = df_nmerge.drop(
                         ['submitter_prev', 'last_updated_prev', 'calb_coef_final_prev', 'obs_source_prev'],
@@ -445,9 +498,14 @@ def update_rating_curve(
                     df_nmerge['calb_coef_final'] = df_nmerge[calb_type]
 
                 ## Update the catchments polygon .gpkg with joined attribute - "src_calibrated"
+                output_catchments = None
                 if os.path.isfile(catchments_poly_path):
                     try:
-                        input_catchments = gpd.read_file(catchments_poly_path)
+                        # (read through the arrow interface - writes below stay on fiona since pyogrio has
+                        # trouble writing columns where all values are null, e.g. calb_coef_final)
+                        input_catchments = gpd.read_file(
+                            catchments_poly_path, engine="pyogrio", use_arrow=True
+                        )
                         ## Create new "src_calibrated" column for viz query
                         if 'src_calibrated' in input_catchments.columns:
                             input_catchments = input_catchments.drop(
@@ -516,13 +574,13 @@ def update_rating_curve(
                     )
                     df_nmerge.to_csv(output_merge_n_csv, index=False)
                     ## output new catchments polygon layer with several new attributes appended
-                    if os.path.isfile(catchments_poly_path):
-                        input_catchments = gpd.read_file(catchments_poly_path)
+                    # (reuse the catchments written above instead of reading the .gpkg a second time)
+                    if output_catchments is not None and os.path.isfile(catchments_poly_path):
                         output_catchments_fileName = os.path.join(
                             os.path.split(catchments_poly_path)[0],
                             "gw_catchments_src_adjust_" + str(branch_id) + ".gpkg",
                         )
-                        output_catchments = input_catchments.merge(df_nmerge, how='left', on='HydroID')
+                        output_catchments = output_catchments.merge(df_nmerge, how='left', on='HydroID')
                         output_catchments.to_file(
                             output_catchments_fileName, driver="GPKG", index=False, engine='fiona'
                         )
@@ -548,17 +606,17 @@ def update_rating_curve(
                 )  # create true/false column to clearly identify where new roughness values are applied
 
                 ## Calculate new discharge_cms with new adjusted ManningN
-                df_htable['discharge_cms'] = np.where(
-                    df_htable['calb_coef_final'].isnull(),
-                    df_htable['precalb_discharge_cms'],
-                    df_htable['precalb_discharge_cms'] / df_htable['calb_coef_final'],
-                )
-
-                ## Replace discharge_cms with 0 or -999 if present in the original discharge
+                # Keep discharge_cms as 0 or -999 if present in the original discharge
                 # (carried over from thalweg notch workaround in SRC post-processing)
-                df_htable['discharge_cms'].mask(df_htable['precalb_discharge_cms'] == 0.0, 0.0, inplace=True)
-                df_htable['discharge_cms'].mask(
-                    df_htable['precalb_discharge_cms'] == -999, -999, inplace=True
+                precalb_discharge = df_htable['precalb_discharge_cms'].to_numpy()
+                df_htable['discharge_cms'] = np.select(
+                    [
+                        precalb_discharge == 0.0,
+                        precalb_discharge == -999,
+                        df_htable['calb_coef_final'].isnull(),
+                    ],
+                    [0.0, -999, precalb_discharge],
+                    default=df_htable['precalb_discharge_cms'] / df_htable['calb_coef_final'],
                 )
 
                 ## Export a new hydroTable.csv and overwrite the previous version
@@ -620,17 +678,25 @@ def update_rating_curve(
 
 
 def branch_network_tracer(df_input_htable):
-    df_input_htable = df_input_htable.astype(
-        {'NextDownID': 'int64'}
-    )  # ensure attribute has consistent format as int
+    # ensure attribute has consistent format as int (skip the full frame copy when it already is)
+    if df_input_htable['NextDownID'].dtype != np.int64:
+        df_input_htable = df_input_htable.astype({'NextDownID': 'int64'})
     # remove all hydroids associated with lake/water body
     # (these often have disjoined artifacts in the network)
-    df_input_htable = df_input_htable.loc[df_input_htable['LakeID'] == -999]
+    df_input_htable = df_input_htable.loc[df_input_htable['LakeID'] == -999].reset_index(drop=True)
     # define start catchments as hydroids that are not found in the "NextDownID" attribute for all
     # other hydroids
     df_input_htable["start_catch"] = ~df_input_htable['HydroID'].isin(df_input_htable['NextDownID'])
 
-    df_input_htable = df_input_htable.set_index('HydroID', drop=False)  # set index to the hydroid
+    ## build hydroid lookups for the network traversal (avoids scanning the df for every hydroid visited)
+    hydroid_pos = {hid: i for i, hid in enumerate(df_input_htable['HydroID'].tolist())}
+    next_down_ids = df_input_htable['NextDownID'].tolist()
+    stream_orders = df_input_htable['order_'].tolist()
+    # number of hydroids draining to each NextDownID (>1 means this is a confluence)
+    upstream_count = df_input_htable['NextDownID'].value_counts().to_dict()
+    route_count = np.full(len(hydroid_pos), np.nan)
+    branch_id = np.full(len(hydroid_pos), np.nan)
+
     branch_heads = deque(
         df_input_htable[df_input_htable['start_catch'] == True]['HydroID'].tolist()
     )  # create deque of hydroids to define start points in the while loop
@@ -639,31 +705,28 @@ def branch_network_tracer(df_input_htable):
     while branch_heads:
         hid = branch_heads.popleft()  # pull off left most hydroid from deque of start hydroids
         Q = deque(
-            df_input_htable[df_input_htable['HydroID'] == hid]['HydroID'].tolist()
+            [hid] if hid in hydroid_pos else []
         )  # create a new deque that will be used to populate all relevant downstream hydroids
         vert_count = 0
         branch_count += 1
         while Q:
             q = Q.popleft()
             if q not in visited:
-                df_input_htable.loc[df_input_htable.HydroID == q, 'route_count'] = (
-                    vert_count  # assign var with flow order ranking
-                )
-                df_input_htable.loc[df_input_htable.HydroID == q, 'branch_id'] = (
-                    branch_count  # assign var with current branch id
-                )
+                pos = hydroid_pos[q]
+                route_count[pos] = vert_count  # assign var with flow order ranking
+                branch_id[pos] = branch_count  # assign var with current branch id
                 vert_count += 1
                 visited.add(q)
                 # find the id for the next downstream hydroid
-                nextid = df_input_htable.loc[q, 'NextDownID']
-                order = df_input_htable.loc[q, 'order_']  # find the streamorder for the current hydroid
+                nextid = next_down_ids[pos]
+                order = stream_orders[pos]  # find the streamorder for the current hydroid
 
-                if nextid not in visited and nextid in df_input_htable.HydroID:
+                if nextid not in visited and nextid in hydroid_pos:
                     # check if the NextDownID is referenced by more than one hydroid
                     # (>1 means this is a confluence)
-                    check_confluence = (df_input_htable.NextDownID == nextid).sum() > 1
-                    nextorder = df_input_htable.loc[
-                        nextid, 'order_'
+                    check_confluence = upstream_count[nextid] > 1
+                    nextorder = stream_orders[
+                        hydroid_pos[nextid]
                     ]  # find the streamorder for the next downstream hydroid
                     # check if the nextdownid streamorder is greater than the current hydroid order and the
                     # nextdownid is a confluence (more than 1 upstream hydroid draining to it)
@@ -675,9 +738,8 @@ def branch_network_tracer(df_input_htable):
                         # starting hydroid
                         continue
                     Q.append(nextid)
-    df_input_htable = df_input_htable.reset_index(
-        drop=True
-    )  # reset index (previously using hydroid as index)
+    df_input_htable['route_count'] = route_count
+    df_input_htable['branch_id'] = branch_id
     # sort the dataframe by branch_id and then by route_count
     # (need this ordered to ensure upstream to downstream ranking for each branch)
     df_input_htable = df_input_htable.sort_values(['branch_id', 'route_count'])
@@ -687,86 +749,52 @@ def branch_network_tracer(df_input_htable):
 def group_manningn_calc(df_nmerge, down_dist_thresh):
     ## Calculate group_calb_coef (mean calb n for consective hydroids) and apply values downsteam to
     # non-calb hydroids (constrained to first Xkm of hydroids - set downstream diststance var as input arg
-    # df_nmerge = df_nmerge.sort_values(by=['NextDownID'])
-    dist_accum = 0
+    # (df_nmerge must be sorted by branch_id and route_count --> see branch_network_tracer)
+    df_nmerge['group_calb_coef'] = accum_group_calb_coef(
+        df_nmerge['branch_id'].to_numpy(dtype=np.float64),
+        df_nmerge['hydroid_calb_coef'].to_numpy(dtype=np.float64),
+        df_nmerge['LENGTHKM'].to_numpy(dtype=np.float64),
+        float(down_dist_thresh),
+    )
+    return df_nmerge
+
+
+@njit
+def accum_group_calb_coef(branch_id, calb_coef, length_km, down_dist_thresh):
+    ## Walk each branch from upstream to downstream and return the group_calb_coef for every hydroid
+    group_calb_coef = np.full(calb_coef.size, np.nan)
+    dist_accum = 0.0
     hyid_count = 0
     hyid_accum_count = 0
-    run_accum_mann = 0
-    group_calb_coef = 0
-    branch_start = 1  # initialize counter and accumulation variables
-    lid_count = 0
-    prev_lid = 'x'
-    for index, row in df_nmerge.iterrows():  # loop through the df (parse by hydroid)
-        if int(df_nmerge.loc[index, 'branch_id']) != branch_start:  # check if start of new branch
-            dist_accum = 0
+    run_accum_mann = 0.0
+    group_coef = 0.0
+    for i in range(calb_coef.size):
+        if i == 0 or branch_id[i] != branch_id[i - 1]:  # check if start of new branch
+            dist_accum = 0.0
             hyid_count = 0
             hyid_accum_count = 0
-            # initialize counter vars
-            run_accum_mann = 0
-            group_calb_coef = 0  # initialize counter vars
-            branch_start = int(
-                df_nmerge.loc[index, 'branch_id']
-            )  # reassign the branch_start var to evaluate on next iteration
-            # use the code below to withold downstream hydroid_calb_coef values
-            # (use this for downstream evaluation tests)
-            '''
-            lid_count = 0
-        if not pd.isna(df_nmerge.loc[index,'ahps_lid']):
-            if df_nmerge.loc[index,'ahps_lid'] == prev_lid:
-                lid_count += 1
-                # only keep the first 3 HydroID n values
-                # (everything else set to null for downstream application)
-                if lid_count > 3:
-                    df_nmerge.loc[index,'hydroid_ManningN'] = np.nan
-                    df_nmerge.loc[index,'featid_ManningN'] = np.nan
-            else:
-                lid_count = 1
-            prev_lid = df_nmerge.loc[index,'ahps_lid']
-            '''
-        if np.isnan(
-            df_nmerge.loc[index, 'hydroid_calb_coef']
-        ):  # check if the hydroid_calb_coef value is nan (indicates a non-calibrated hydroid)
-            df_nmerge.loc[index, 'accum_dist'] = (
-                row['LENGTHKM'] + dist_accum
-            )  # calculate accumulated river distance
-            dist_accum += row['LENGTHKM']  # add hydroid length to the dist_accum var
+            run_accum_mann = 0.0
+            group_coef = 0.0  # initialize counter vars
+        # check if the hydroid_calb_coef value is nan (indicates a non-calibrated hydroid)
+        if np.isnan(calb_coef[i]):
+            dist_accum += length_km[i]  # calculate accumulated river distance
             hyid_count = 0  # reset the hydroid counter to 0
-            df_nmerge.loc[index, 'hyid_accum_count'] = hyid_accum_count  # output the hydroid accum counter
-            # check if the accum distance is less than Xkm downstream from valid hydroid_calb_coef group value
-            if dist_accum < down_dist_thresh:
-                # only apply the group_calb_coef if there are 2 or more valid hydorids that contributed to the
-                # upstream group_calb_coef
-                if hyid_accum_count > 1:
-                    df_nmerge.loc[index, 'group_calb_coef'] = (
-                        group_calb_coef  # output the group_calb_coef var
-                    )
-            else:
-                # reset the running average manningn variable (greater than 10km downstream)
-                run_avg_mann = 0
+            # only apply the group_calb_coef if the accum distance is less than Xkm downstream from valid
+            # hydroid_calb_coef group value and there are 2 or more valid hydorids that contributed to the
+            # upstream group_calb_coef
+            if dist_accum < down_dist_thresh and hyid_accum_count > 1:
+                group_calb_coef[i] = group_coef
         # performs the following for hydroids that have a valid hydroid_calb_coef value
         else:
-            dist_accum = 0
-            hyid_count += 1  # initialize vars
-            df_nmerge.loc[index, 'accum_dist'] = 0  # output the accum_dist value (set to 0)
+            dist_accum = 0.0
+            hyid_count += 1
             if hyid_count == 1:  # checks if this the first in a series of valid hydroid_calb_coef values
-                run_accum_mann = 0
+                run_accum_mann = 0.0
                 hyid_accum_count = 0  # initialize counter and running accumulated manningN value
             # calculate the group_calb_coef (NOTE: this will continue to change as more hydroid values are
             # accumulated in the "group" moving downstream)
-            group_calb_coef = (row['hydroid_calb_coef'] + run_accum_mann) / float(hyid_count)
-            df_nmerge.loc[index, 'group_calb_coef'] = group_calb_coef  # output the group_calb_coef var
-            df_nmerge.loc[index, 'hyid_count'] = hyid_count  # output the hyid_count var
-            run_accum_mann += row[
-                'hydroid_calb_coef'
-            ]  # add current hydroid manningn value to the running accum mann var
+            group_coef = (calb_coef[i] + run_accum_mann) / hyid_count
+            group_calb_coef[i] = group_coef
+            run_accum_mann += calb_coef[i]  # add current hydroid manningn value to the running accum var
             hyid_accum_count += 1  # increase the # of hydroid accum counter
-            df_nmerge.loc[index, 'hyid_accum_count'] = hyid_accum_count  # output the hyid_accum_count var
-
-    ## Delete unnecessary intermediate outputs
-    if 'hyid_count' in df_nmerge.columns:
-        df_nmerge = df_nmerge.drop(
-            ['hyid_count', 'accum_dist', 'hyid_accum_count'], axis=1, errors='ignore'
-        )  # drop hydroid counter if it exists
-    ## drop accum vars from group calc
-    # df_nmerge = df_nmerge.drop(['accum_dist','hyid_accum_count'], axis=1)
-    return df_nmerge
+    return group_calb_coef